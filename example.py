@@ -12,7 +12,7 @@ font_library = FontLibrary('fonts')
 # [print(font) for font in font_library.library]
 
 
-fonts = list()
+styles = list()
 subs = Path('.').glob("*.ssa")
 for sub in subs:
     logger.info(f"Processing subtitle file: {sub}")
@@ -29,19 +29,24 @@ for sub in subs:
         logger.critical(f"Cannot open the file: {str(sub.absolute())}")
         sys.exit(3)
     # [print(style) for style in sub_fonts.styles]
-
-    # Compare the styles found in the subtitle file with fonts in the library and
-    # return the fonts that match the best.  The threshold is set to 90% which seems
-    # to work best for identifying fonts.  If a font can't be found, there will be
-    # a warning in the logs.
-    for style in sub_fonts.styles:
-        fonts.append(
-            font_library.find_font_by_full_name(
-                family=style.family,
-                subfamily=style.subfamily,
-                downgrade=True
-            )
-        )
+    styles.extend(sub_fonts.styles)
+
+# Many styles share the same family/subfamily across subtitle files, so only look up
+# each unique combination once.  Subfamilies from dialogue tags come back in no
+# particular order, so they're compared as sets.
+unique_queries = dict()
+for style in styles:
+    unique_queries.setdefault((style.family, frozenset(style.subfamily)), style)
+
+# Compare the unique styles found in all of the subtitle files with fonts in the library
+# in a single batch and return the fonts that match the best.  The threshold is set to
+# 90% which seems to work best for identifying fonts.  If a font can't be found, there
+# will be a warning in the logs.
+resolved = dict(zip(
+    unique_queries.keys(),
+    font_library.find_fonts_batch(list(unique_queries.values()), downgrade=True)
+))
+fonts = [resolved[(style.family, frozenset(style.subfamily))] for style in styles]
 
 # Remove all duplicate fonts and return the fonts found.
 fonts = set([i.font for i in fonts if i])
@@ -0,0 +1,52 @@
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Any
+
+# Everything a truncated, corrupt, or incompatible pickle can raise while it is being loaded or unpacked.
+CACHE_LOAD_ERRORS = (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, IndexError, KeyError,
+                     TypeError, ValueError)
+
+
+def load_pickle(path: Path) -> Any:
+    """Load a pickled cache file.
+
+    Args:
+        path (Path): The location of the cache file.
+
+    Returns:
+        Any: The unpickled object.
+
+    Raises:
+        OSError: The cache file is missing or unreadable.
+        pickle.UnpicklingError: The cache file is not a usable pickle, see CACHE_LOAD_ERRORS for the full list.
+    """
+    with path.open('rb') as f:
+        return pickle.load(f)
+
+
+def dump_pickle(path: Path, obj: Any):
+    """Atomically write an object to a pickled cache file.
+
+    The object is written to a temporary file next to the cache first and moved into place, so concurrent writers
+    never leave a truncated cache behind.
+
+    Args:
+        path (Path): The location of the cache file.
+        obj (Any): The object to pickle.
+
+    Raises:
+        OSError: The cache file could not be written.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = None
+    try:
+        with tempfile.NamedTemporaryFile('wb', dir=path.parent, delete=False) as f:
+            tmp_path = f.name
+            pickle.dump(obj, f, protocol=5)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if tmp_path:
+            Path(tmp_path).unlink(missing_ok=True)
+        raise
@@ -1,13 +1,24 @@
-from dataclasses import dataclass
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional, Union
+from typing import Callable, Optional, Union
 
+import numpy as np
 from fontTools import ttLib
-from fuzzywuzzy import fuzz
 from loguru import logger
+from rapidfuzz import fuzz, process
 
+from fontscrape.cache import CACHE_LOAD_ERRORS, dump_pickle, load_pickle
+from fontscrape.subparse import SubFont
 
-@dataclass
+DEFAULT_CACHE_PATH = Path.home() / ".cache" / "sisyphus-font" / "library.pkl"
+# Bump whenever the layout of the cached entries changes.
+_CACHE_VERSION = 1
+
+
+@dataclass(frozen=True, slots=True, eq=False)
 class Font:
     """A Font object containing all the information for a processed font.
 
@@ -16,24 +27,36 @@ class Font:
         subfamily (list[str]): The font subfamily.
         full_name (str): The full name of the font.
         font_path (Path): The filesystem location of the font.
+        full_name_lower (str): The lowercased full name of the font.
+        full_name_semi_stripped (str): The lowercased full name with all occurrences of 'semi' removed.
+        subfamily_joined (str): The subfamily joined into a single space-separated string.
+        subfamily_no_regular_joined (str): The subfamily without 'bold'/'italic' joined into a single space-separated string.
     """
     family: str
     subfamily: list[str]
     full_name: str
     font_path: Path
+    full_name_lower: str
+    full_name_semi_stripped: str
+    subfamily_joined: str
+    subfamily_no_regular_joined: str
 
     def __eq__(self, other):
-        return self.full_path == other.full_path
+        if not isinstance(other, Font):
+            return NotImplemented
+        return self.font_path == other.font_path
 
     def __hash__(self):
-        return hash(self.full_name)
+        return hash(self.font_path)
 
 
-@dataclass
+@functools.total_ordering
+@dataclass(frozen=True, eq=False)
 class FontResult:
     """The result of a font comparison.
 
     FontResults can be compared against each other, where the `family_match_score` is compared first, then the `subfamily_match_score` afterwards.
+    They are immutable since cached results are handed out to every caller asking the same question.
 
     Attributes:
         font (Font): The Font that matched.
@@ -45,35 +68,78 @@ class FontResult:
     family_match_score: int
     subfamily_match_score: int
     downgrade: bool = False
+    _score: int = field(init=False, repr=False, compare=False)
 
-    def _total_score(self, other):
-        self_score = self.family_match_score * 1000 + self.subfamily_match_score
-        other_score = other.family_match_score * 1000 + other.subfamily_match_score
-        return (self_score, other_score)
+    def __post_init__(self):
+        object.__setattr__(self, '_score', self.family_match_score * 1000 + self.subfamily_match_score)
 
     def __eq__(self, other):
-        s, o = self._total_score(other)
-        return s == o
-
-    def __ne__(self, other):
-        s, o = self._total_score(other)
-        return s != o
+        return self._score == other._score
 
     def __lt__(self, other):
-        s, o = self._total_score(other)
-        return s < o
+        return self._score < other._score
 
-    def __le__(self, other):
-        s, o = self._total_score(other)
-        return s <= o
 
-    def __gt__(self, other):
-        s, o = self._total_score(other)
-        return s > o
+def _read_names(font_path: Path) -> Optional[tuple[str, str, str]]:
+    """Read the family, subfamily, and full name strings from a font's name table.
+
+    Args:
+        font_path (Path): The filesystem location of the font.
 
-    def __ge__(self, other):
-        s, o = self._total_score(other)
-        return s >= o
+    Returns:
+        Optional[tuple[str, str, str]]: The family, subfamily, and full name, or None if the file could not be parsed
+            or is missing any of them.
+    """
+    try:
+        with ttLib.TTFont(font_path, lazy=True, fontNumber=0) as ttf:
+            name = ttf['name']
+            names = name.getBestFamilyName(), name.getBestSubFamilyName(), name.getBestFullName()
+    except (ttLib.TTLibError, KeyError) as e:
+        logger.warning(f"Could not parse font: {font_path}, {e}")
+        return None
+    if None in names:
+        logger.warning(f"Could not parse font: {font_path}, missing family, subfamily, or full name")
+        return None
+    return names
+
+
+def _make_font(font_path: Path, names: tuple[str, str, str]) -> Font:
+    """Build a Font from the strings read out of its name table.
+
+    Args:
+        font_path (Path): The filesystem location of the font.
+        names (tuple[str, str, str]): The family, subfamily, and full name of the font.
+
+    Returns:
+        Font: The processed Font.
+    """
+    family, subfamily, full_name = names
+    subfamily = sorted([i.lower() for i in subfamily.split(" ")])
+    return Font(
+        family=family,
+        subfamily=subfamily,
+        full_name=full_name,
+        font_path=font_path,
+        full_name_lower=full_name.lower(),
+        full_name_semi_stripped=full_name.lower().replace("semi", ""),
+        subfamily_joined=' '.join(subfamily),
+        subfamily_no_regular_joined=' '.join(i for i in subfamily if i not in ("bold", "italic"))
+    )
+
+
+def _score_cutoff(threshold: int) -> float:
+    """Convert a whole-percentage threshold into a raw rapidfuzz score cutoff.
+
+    Scores are rounded before they are compared to the threshold, so anything that rounds up to it has to survive
+    the cutoff. rapidfuzz only accepts cutoffs between 0 and 100.
+
+    Args:
+        threshold (int): The threshold to match against.
+
+    Returns:
+        float: The score cutoff to hand to rapidfuzz.
+    """
+    return min(max(threshold - 0.5, 0), 100)
 
 
 class FontLibrary:
@@ -82,35 +148,166 @@ class FontLibrary:
     Attributes:
         library (list[Font]): A list of Fonts containing font information from the fonts in the library path.
         library_path (Union[Path, str]): The path of the directory containing the fonts to parse.
+        cache_path (Optional[Path]): The location of the parsed font cache, or None if caching is disabled.
     """
 
-    library: list[Font]
+    _library: list[Font]
     library_path: Union[Path, str]
-
-    def __init__(self, library_path: Union[Path, str]):
+    cache_path: Optional[Path]
+    _family_choices: list[str]
+    _fullname_choices: list[str]
+    _semi_stripped_choices: list[str]
+    _full_name_cache: Callable[..., Optional[FontResult]]
+    _by_family: dict[str, list[Font]]
+    _by_full: dict[str, Font]
+
+    def __init__(self, library_path: Union[Path, str],
+                 cache_path: Optional[Union[Path, str]] = DEFAULT_CACHE_PATH):
         """Create the font library.
 
         Args:
             library_path (Union[Path, str]): The path of the directory containing the fonts to parse.
+            cache_path (Optional[Union[Path, str]], optional): Where to cache parsed fonts between runs, None to disable. Defaults to DEFAULT_CACHE_PATH.
         """
         self.library_path = Path(library_path)
+        self.cache_path = Path(cache_path) if cache_path else None
+        self._full_name_cache = functools.lru_cache(maxsize=1024)(self._find_font_by_full_name)
+        self.reload()
+
+    @property
+    def library(self) -> list[Font]:
+        """list[Font]: The parsed fonts. Assigning a new list rebuilds the lookup indexes."""
+        return self._library
+
+    @library.setter
+    def library(self, fonts: list[Font]):
+        self._library = fonts
+        self._index_library()
+
+    def reload(self):
+        """Re-scan the library directory and rebuild the lookup indexes."""
         self.library = self.parse_library()
 
+    def _index_library(self):
+        """Build the choice lists and exact-match lookups for the current library and drop any cached matches."""
+        self._full_name_cache.cache_clear()
+        self._family_choices = [f.family.lower() for f in self._library]
+        self._fullname_choices = [f.full_name_lower for f in self._library]
+        self._semi_stripped_choices = [f.full_name_semi_stripped for f in self._library]
+        self._by_family = dict()
+        for f in self._library:
+            self._by_family.setdefault(f.family.lower(), list()).append(f)
+        self._by_full = {f.full_name_lower: f for f in self._library}
+
     def parse_library(self) -> list[Font]:
-        """Parse all of the fonts in the library."""
-        results = list()
-        for f in self.library_path.glob("*"):
-            if f.suffix.lower() not in [".ttf", ".otf"]:
-                continue
-            ttf = ttLib.TTFont(f)['name']
-            font = Font(
-                family=ttf.getBestFamilyName(),
-                subfamily=sorted([i.lower() for i in ttf.getBestSubFamilyName().split(" ")]),
-                full_name=ttf.getBestFullName(),
-                font_path=f
-            )
-            results.append(font)
-        return results
+        """Parse all of the fonts in the library.
+
+        Fonts whose modification time and size match the on-disk cache are loaded from it, only new or
+        changed fonts are parsed.
+        """
+        paths = [f for f in self.library_path.glob("*") if f.suffix.lower() in [".ttf", ".otf"]]
+        cache = self._load_cache()
+        library_dir = self.library_path.resolve()
+        entries, names, stale = dict(), dict(), list()
+        for f in paths:
+            stat = f.stat()
+            key = str(f.resolve())
+            entry = cache.get(key)
+            if entry and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                names[f] = entry[2]
+            else:
+                stale.append(f)
+            entries[key] = (stat.st_mtime_ns, stat.st_size)
+
+        if stale:
+            with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as ex:
+                names.update(zip(stale, ex.map(_read_names, stale)))
+
+        removed = [k for k in cache if Path(k).parent == library_dir and k not in entries]
+        if stale or removed:
+            for k in removed:
+                del cache[k]
+            for f in stale:
+                key = str(f.resolve())
+                cache[key] = (*entries[key], names[f])
+            self._save_cache(cache)
+        return [_make_font(f, names[f]) for f in paths if names[f]]
+
+    def _load_cache(self) -> dict[str, tuple[int, int, Optional[tuple[str, str, str]]]]:
+        """Load the parsed font cache.
+
+        Returns:
+            dict[str, tuple[int, int, Optional[tuple[str, str, str]]]]: The (mtime, size, names) entries keyed by font path, empty if there is no usable cache.
+        """
+        if not self.cache_path or not self.cache_path.exists():
+            return dict()
+        try:
+            cached = load_pickle(self.cache_path)
+        except CACHE_LOAD_ERRORS as e:
+            logger.warning(f"Could not load font cache: {self.cache_path}, {e}")
+            return dict()
+        if not isinstance(cached, dict) or cached.get("version") != _CACHE_VERSION:
+            logger.debug(f"Ignoring font cache with a different format: {self.cache_path}")
+            return dict()
+        return cached["entries"]
+
+    def _save_cache(self, cache: dict[str, tuple[int, int, Optional[tuple[str, str, str]]]]):
+        """Write the parsed font cache to disk.
+
+        The cache is written to a temporary file first and moved into place so concurrent writers never leave a
+        truncated cache behind.
+
+        Args:
+            cache (dict[str, tuple[int, int, Optional[tuple[str, str, str]]]]): The (mtime, size, names) entries keyed by font path.
+        """
+        if not self.cache_path:
+            return
+        try:
+            dump_pickle(self.cache_path, {"version": _CACHE_VERSION, "entries": cache})
+        except OSError as e:
+            logger.warning(f"Could not write font cache: {self.cache_path}, {e}")
+
+    def _score_library(self, query: str, choices: list[str], threshold: int) -> list[tuple[Font, int]]:
+        """Score a query against one of the cached library choice lists.
+
+        Args:
+            query (str): The string to compare against.
+            choices (list[str]): The library choice list (family, full name, etc.) to score against.
+            threshold (int): The threshold to match against.
+
+        Returns:
+            list[tuple[Font, int]]: The fonts that meet/exceed the threshold along with their scores.
+        """
+        # Scores are rounded to whole percentages before the threshold check like fuzzywuzzy did.
+        scores = process.cdist(
+            [query], choices, scorer=fuzz.ratio, workers=-1, dtype=np.uint8, score_cutoff=_score_cutoff(threshold))[0]
+        return [(self.library[idx], int(scores[idx])) for idx in np.where(scores >= threshold)[0]]
+
+    def _best_match(self, family: str,
+                    subfamily: list[str],
+                    results: list[FontResult]) -> Optional[FontResult]:
+        """Select and log the best FontResult out of all of the candidates.
+
+        Args:
+            family (str): The font family that was searched for.
+            subfamily (list[str]): The font subfamily that was searched for.
+            results (list[FontResult]): The candidate matches.
+
+        Returns:
+            Optional[FontResult]: The best FontResult match, otherwise None.
+        """
+        if not results:
+            logger.warning(
+                f"Could not find font: {family}, subfamilies: {subfamily}")
+            return None
+
+        result = max(results)
+        font = result.font
+        dg_flag = "↓" if result.downgrade else " "
+        sfam = ', '.join(font.subfamily) if subfamily else "None"
+        logger.debug(
+            f"Found font: [{dg_flag}{result.family_match_score:>3}%] {font.family}, subfamilies: {sfam}")
+        return result
 
     def find_font_by_families(self, family: str,
                               subfamily: Union[list[str], str],
@@ -123,58 +320,31 @@ class FontLibrary:
             family (str): The font family.
             subfamily (Union[list[str]], str]): The font subfamily.
             ignore_regular (bool, optional): Ignore the 'regular' subfamily when doing comparisons. Defaults to False.
-            downgrade (bool, optional): Allow the font to downgrade to the base font sans subfamily. Defaults to False.
+            downgrade (bool, optional): Kept for parity with `find_font_by_full_name`; matching is already done on the family alone. Defaults to False.
             threshold (int, optional): The threshold to match against. Defaults to 90.
 
         Returns:
             Optional[FontResult]: The FontResult match if it meets/exceeds the threshold, otherwise None.
         """
-        orig_subfamily = subfamily
         if isinstance(subfamily, str):
-            subfamily = [subfamily.split(" ")]
-        sfam = [i.lower() for i in subfamily]
-        results = list()
-
+            subfamily = subfamily.split(" ")
+        orig_subfamily = list(subfamily)
+        subfamily = [i.lower() for i in subfamily]
         if ignore_regular:
             subfamily = [i for i in subfamily if i not in ["bold", "italic"]]
-            subfamily = ' '.join(subfamily)
-            for font in self.library:
-                sfam = subfamily
-                if ignore_regular:
-                    sfam = [i for i in font.subfamily if i not in [
-                        "bold", "italic"]]
-                sfam = ' '.join(sfam)
-                family_score = fuzz.ratio(family, font.family)
-                subfamily_score = fuzz.ratio(subfamily, sfam)
-
-                if family_score >= threshold:
-                    results.append(FontResult(
-                        font, family_score, subfamily_score))
-            if not results and downgrade:
-                sfam = ' '.join(sfam)
-                family_score = fuzz.ratio(family, font.family)
-
-                if family_score >= threshold:
-                    results.append(FontResult(
-                        font, family_score, subfamily_score, True))
-
-            try:
-                results = sorted(results)[-1]
-            except IndexError:
-                results = None
-
-            if not results:
-                subfamily = ', '.join(subfamily) if subfamily else "None"
-                logger.warning(
-                    f"Could not find font: {family}, subfamilies: {orig_subfamily}")
-                return results
-
-            font = results.font
-            dg_flag = "↓" if results.downgrade else " "
-            subfamily = ', '.join(font.subfamily) if subfamily else "None"
-            logger.debug(
-                f"Found font: [{dg_flag}{results.family_match_score:>3}%] {font.family}, subfamilies: {subfamily}")
-            return results
+        subfamily = ' '.join(subfamily)
+
+        if (exact := self._by_family.get(family.lower())):
+            matches = [(font, 100) for font in exact]
+        else:
+            matches = self._score_library(family.lower(), self._family_choices, threshold)
+
+        results = list()
+        for font, family_score in matches:
+            sfam = font.subfamily_no_regular_joined if ignore_regular else font.subfamily_joined
+            subfamily_score = round(fuzz.ratio(subfamily, sfam))
+            results.append(FontResult(font, family_score, subfamily_score))
+        return self._best_match(family, orig_subfamily, results)
 
     def find_font_by_full_name(self, family: str,
                                subfamily: Union[list[str], str],
@@ -191,51 +361,29 @@ class FontLibrary:
         Returns:
             Optional[FontResult]: The FontResult match if it meets/exceeds the threshold, otherwise None.
         """
-        orig_subfamily = subfamily
         if isinstance(subfamily, str):
-            subfamily = [subfamily.split(" ")]
-        results = list()
-        for font in self.library:
-            sfmt = ' '.join(i.capitalize() for i in subfamily)
-            full_name = f"{family} {sfmt}"
-            family_score = fuzz.ratio(
-                full_name.lower(), font.full_name.lower()
-            )
-            if family_score >= threshold:
-                results.append(FontResult(font, family_score, 0))
+            subfamily = subfamily.split(" ")
+        return self._full_name_cache(family, tuple(subfamily), downgrade, threshold)
+
+    def _find_font_by_full_name(self, family: str,
+                                subfamily: tuple[str, ...],
+                                downgrade: bool,
+                                threshold: int) -> Optional[FontResult]:
+        """Uncached implementation of `find_font_by_full_name` using hashable arguments."""
+        sfmt = ' '.join(i.capitalize() for i in subfamily)
+        full_name = f"{family} {sfmt}".lower()
+        if (font := self._by_full.get(full_name.rstrip())):
+            results = [FontResult(font, 100, 100)]
+        else:
+            results = [FontResult(font, score, 0)
+                       for font, score in self._score_library(full_name, self._fullname_choices, threshold)]
         if not results:
-            for font in self.library:
-                ffull_name = ' '.join([i.replace("semi", "") for i in [
-                                      j for j in font.full_name.lower().split(" ")]])
-                sfmt = ' '.join(i.capitalize() for i in subfamily)
-                full_name = f"{family} {sfmt}"
-                family_score = fuzz.ratio(full_name.lower(), ffull_name)
-                if family_score >= threshold:
-                    results.append(FontResult(font, family_score, 0))
+            results = [FontResult(font, score, 0)
+                       for font, score in self._score_library(full_name, self._semi_stripped_choices, threshold)]
         if not results and downgrade:
-            for font in self.library:
-                full_name = f"{family}"
-                family_score = fuzz.ratio(
-                    full_name.lower(), font.full_name.lower())
-                if family_score >= threshold:
-                    results.append(FontResult(font, family_score, 0, True))
-
-        try:
-            results = sorted(results)[-1]
-        except IndexError:
-            results = None
-
-        if not results:
-            subfamily = ', '.join(subfamily) if subfamily else "None"
-            logger.warning(
-                f"Could not find font: {family}, subfamilies: {orig_subfamily}")
-        else:
-            font = results.font
-            dg_flag = "↓" if results.downgrade else " "
-            subfamily = ', '.join(font.subfamily) if subfamily else "None"
-            logger.debug(
-                f"Found font: [{dg_flag}{results.family_match_score:>3}%] {font.family}, subfamilies: {subfamily}")
-        return results
+            results = [FontResult(font, score, 0, True)
+                       for font, score in self._score_library(family.lower(), self._fullname_choices, threshold)]
+        return self._best_match(family, list(subfamily), results)
 
     def find_font_by_family(self, family: str, threshold: int = 90) -> list[FontResult]:
         """Find a font by only comparing against the font family.
@@ -247,9 +395,43 @@ class FontLibrary:
         Returns:
             List[FontResult]: A list of FontResult matches that meet/exceed the threshold sorted by confidence (decending).
         """
+        results = [FontResult(font, score, 0)
+                   for font, score in self._score_library(family.lower(), self._family_choices, threshold)]
+        results.sort(reverse=True)
+        return results
+
+    def find_fonts_batch(self, styles: list[SubFont],
+                         downgrade: bool = False,
+                         threshold: int = 90) -> list[Optional[FontResult]]:
+        """Find fonts for many subtitle styles at once by scoring every style against every font's full name.
+
+        Styles that do not meet the threshold in the batch fall back to `find_font_by_full_name`.
+
+        Args:
+            styles (list[SubFont]): The subtitle fonts to find.
+            downgrade (bool, optional): Allow the font to downgrade to the base font sans subfamily. Defaults to False.
+            threshold (int, optional): The threshold to match against. Defaults to 90.
+
+        Returns:
+            list[Optional[FontResult]]: The FontResult match for each style (in order) if it meets/exceeds the threshold, otherwise None.
+        """
+        if not styles or not self.library:
+            return [self.find_font_by_full_name(s.family, s.subfamily, downgrade, threshold) for s in styles]
+
+        queries = [f"{s.family} {' '.join(sf.capitalize() for sf in s.subfamily)}".lower() for s in styles]
+        scores = process.cdist(
+            queries, self._fullname_choices, scorer=fuzz.ratio, workers=-1, dtype=np.uint8,
+            score_cutoff=_score_cutoff(threshold))
+        best = scores.argmax(axis=1)
+
         results = list()
-        for font in self.library:
-            family_score = fuzz.ratio(family, font.family)
-            if family_score >= threshold:
-                results.append(FontResult(font, family_score, 0))
-        return sorted(results, reverse=True)
+        for style, query, idx, row in zip(styles, queries, best, scores):
+            if (font := self._by_full.get(query.rstrip())):
+                result = FontResult(font, 100, 100)
+            elif row[idx] >= threshold:
+                result = FontResult(self.library[idx], int(row[idx]), 0)
+            else:
+                results.append(self.find_font_by_full_name(style.family, style.subfamily, downgrade, threshold))
+                continue
+            results.append(self._best_match(style.family, style.subfamily, [result]))
+        return results
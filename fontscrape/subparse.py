@@ -1,11 +1,101 @@
-import re
-from dataclasses import dataclass
+import sys
+from dataclasses import dataclass, field
 from enum import Enum
 from pathlib import Path
-from typing import Union
+from typing import Optional, Union
 
 from loguru import logger
 
+from fontscrape.cache import CACHE_LOAD_ERRORS, dump_pickle, load_pickle
+
+try:
+    import re2 as _re_engine
+except ImportError:
+    import re as _re_engine
+
+# Kept free of lookarounds so that it compiles with both RE2 and `re`.
+_FN_RE = _re_engine.compile(r'\\fn([^}\\\n]+)[}\\]')
+
+# Bump whenever the parsing results or the layout of the cached subtitle data changes.
+_CACHE_VERSION = 1
+
+
+def _scan_int_tag(text: str, tag: str, width: int = 0) -> Optional[int]:
+    """Find the value of the first numeric override tag (e.g. '\\b1') without using a regex.
+
+    Args:
+        text (str): The dialogue text to scan.
+        tag (str): The override tag including the leading backslash.
+        width (int, optional): The exact number of digits the value must have, 0 for any. Defaults to 0.
+
+    Returns:
+        Optional[int]: The value of the first matching tag, otherwise None.
+    """
+    start = text.find(tag)
+    while start >= 0:
+        i = j = start + len(tag)
+        while j < len(text) and text[j].isdecimal():
+            j += 1
+        if i < j < len(text) and text[j] in '}\\' and (not width or j - i == width):
+            return int(text[i:j])
+        start = text.find(tag, start + 1)
+    return None
+
+
+def _fields(line: str, indices: tuple[int, ...]) -> list[str]:
+    """Extract only the requested comma-separated fields from a line in a single pass.
+
+    The last requested field runs to the end of the line, so a trailing text field keeps any commas in it.
+
+    Args:
+        line (str): The line to extract the fields from.
+        indices (tuple[int, ...]): The field indices to extract in ascending order.
+
+    Returns:
+        list[str]: The requested fields, empty strings for fields past the end of the line.
+    """
+    results = list()
+    current, start = 0, 0
+    for target in indices:
+        while current < target:
+            start = line.find(',', start) + 1
+            if not start:
+                return results + [''] * (len(indices) - len(results))
+            current += 1
+        if target == indices[-1]:
+            results.append(line[start:])
+        else:
+            end = line.find(',', start)
+            results.append(line[start:] if end < 0 else line[start:end])
+    return results
+
+
+def _parse_override_tags(dialogue: str) -> tuple[Optional[str], Optional[int], Optional[int]]:
+    """Find the first font name, bold, and italic override tags in a line of dialogue.
+
+    Args:
+        dialogue (str): The text of the dialogue line.
+
+    Returns:
+        tuple[Optional[str], Optional[int], Optional[int]]: The font name, bold value, and italic value, None if not present.
+    """
+    # Override tags only ever appear inside '{...}' blocks, so only those are scanned.
+    family, bold, italic = None, None, None
+    start = dialogue.find('{')
+    while start >= 0:
+        end = dialogue.find('}', start)
+        block = dialogue[start:] if end < 0 else dialogue[start:end + 1]
+        if family is None and (font_name := _FN_RE.search(block)):
+            family = font_name.group(1)
+        if bold is None:
+            bold = _scan_int_tag(block, '\\b')
+        if italic is None:
+            italic = _scan_int_tag(block, '\\i', width=1)
+        if end < 0 or (family is not None and bold is not None and italic is not None):
+            break
+        start = dialogue.find('{', end)
+    return family, bold, italic
+
 
 class StyleFields(Enum):
     """Style field breakdown (v4) for the SSA content.
@@ -28,60 +118,126 @@ class SubFont:
     style: str
     family: str
     subfamily: list[str]
+    _subfamily_set: frozenset[str] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._subfamily_set = frozenset(self.subfamily)
 
 
 class SubParse:
     """Parse a SubStation Alpha subtitle file for all used fonts.
 
     Attributes:
-        content (list[str]): The content of the subtitle file.
         ssa_file (Path): The Path to the subtitle file.
+        filter_unused_styles (bool): Whether styles not referenced in the dialogue are dropped.
         styles (list[SubFont]): A list of all SubFonts found in the subtitles.
     """
 
     ssa_file: Path
-    content: list[str]
+    filter_unused_styles: bool
     _styles: list[SubFont]
     _dialogue: list[SubFont]
 
-    def __init__(self, ssa_file: Union[Path, str]):
+    def __init__(self, ssa_file: Union[Path, str], filter_unused_styles: bool = True):
         """Initialize the SubParse object.
 
         Args:
             ssa_file (Union[Path, str]): The path to the subtitle file.
+            filter_unused_styles (bool, optional): Drop styles that aren't referenced in the dialogue. Defaults to True.
 
         Raises:
             FileNotFoundError: The file specified was not found.
             PermissionError: Not allowed to open the specified file.
         """
         self.ssa_file = Path(ssa_file)
-        self.content = self.get_content()
-        self._styles = self.process_style_section()
-        self._dialogue = self.process_dialogue_section()
+        self.filter_unused_styles = filter_unused_styles
+        style_lines, dialogue_lines = self._split_sections()
+        self._styles = self.process_style_section(style_lines, dialogue_lines)
+        self._dialogue = self.process_dialogue_section(dialogue_lines)
 
-    def get_content(self) -> list[str]:
-        """Load all of the content of the SSA file to memory for parsing.
+    @classmethod
+    def from_cache(cls, ssa_file: Union[Path, str], cache_dir: Union[Path, str],
+                   filter_unused_styles: bool = True) -> "SubParse":
+        """Load the parsed subtitle fonts from the cache, parsing and caching the file if it has changed.
+
+        Args:
+            ssa_file (Union[Path, str]): The path to the subtitle file.
+            cache_dir (Union[Path, str]): The directory the parsed results are cached in.
+            filter_unused_styles (bool, optional): Drop styles that aren't referenced in the dialogue. Defaults to True.
 
         Returns:
-            list[str]: A list of strings (all the subtitle content)
+            SubParse: The parsed subtitle file.
 
         Raises:
             FileNotFoundError: The file specified was not found.
             PermissionError: Not allowed to open the specified file.
         """
-        with self.ssa_file.open('r', encoding="utf-8") as f:
-            return f.readlines()
+        ssa_file = Path(ssa_file)
+        stat = ssa_file.stat()
+        path, key = str(ssa_file.resolve()), (stat.st_size, stat.st_mtime_ns, filter_unused_styles)
+        cache_file = Path(cache_dir) / f"{ssa_file.name}.pkl"
+
+        try:
+            cached = load_pickle(cache_file)
+            if cached.get("version") == _CACHE_VERSION and cached["path"] == path and cached["key"] == key:
+                sub = cls.__new__(cls)
+                sub.ssa_file = ssa_file
+                sub.filter_unused_styles = filter_unused_styles
+                sub._styles, sub._dialogue = cached["styles"], cached["dialogue"]
+                return sub
+        except FileNotFoundError:
+            pass
+        except CACHE_LOAD_ERRORS as e:
+            logger.warning(f"Could not load subtitle cache: {cache_file}, {e}")
 
-    def process_style_section(self) -> list[SubFont]:
+        sub = cls(ssa_file, filter_unused_styles)
+        try:
+            dump_pickle(cache_file, {
+                "version": _CACHE_VERSION,
+                "path": path,
+                "key": key,
+                "styles": sub._styles,
+                "dialogue": sub._dialogue
+            })
+        except OSError as e:
+            logger.warning(f"Could not write subtitle cache: {cache_file}, {e}")
+        return sub
+
+    def _split_sections(self) -> tuple[list[str], list[str]]:
+        """Stream the SSA file and bucket the style and dialogue lines for parsing.
+
+        Returns:
+            tuple[list[str], list[str]]: The 'Style' lines and the 'Dialogue' lines.
+
+        Raises:
+            FileNotFoundError: The file specified was not found.
+            PermissionError: Not allowed to open the specified file.
+        """
+        style_lines, dialogue_lines = list(), list()
+        with self.ssa_file.open('rb', buffering=1 << 20) as f:
+            # Binary iteration only breaks on '\n', so splitlines() also breaks on a bare '\r' the way text mode's
+            # universal newlines did.
+            for raw in f:
+                for line in raw.splitlines():
+                    if line.startswith(b'Style: '):
+                        style_lines.append(line.decode('utf-8'))
+                    elif line.startswith(b'Dialogue: '):
+                        dialogue_lines.append(line.decode('utf-8'))
+        return style_lines, dialogue_lines
+
+    def process_style_section(self, style_lines: list[str], dialogue_lines: list[str]) -> list[SubFont]:
         """Process the Style v4 section of the subtitles.
 
+        Args:
+            style_lines (list[str]): The 'Style' lines of the subtitles.
+            dialogue_lines (list[str]): The 'Dialogue' lines of the subtitles.
+
         Returns:
             list[SubFont]: A list of all the found fonts in the Style v4 section.
         """
-        content = [i for i in self.content if i.startswith('Style: ')]
         results = list()
-        for c in content:
-            c = c.split(':')[1].split(',')
+        for c in style_lines:
+            c = c.split(':', 1)[1].split(',')
             style = c[StyleFields.STYLE_NAME.value]
             family = c[StyleFields.FAMILY.value]
             subfamily = list()
@@ -89,44 +245,48 @@ class SubParse:
                 subfamily.append("bold")
             if c[StyleFields.SUBFAMILY_ITALIC.value] == "-1":
                 subfamily.append("italic")
-            results.append(SubFont(style.strip(), family, subfamily))
+            results.append(SubFont(sys.intern(style.strip()), family, subfamily))
+
+        if not self.filter_unused_styles:
+            return results
 
-        dialogue = [i for i in self.content if i.startswith('Dialogue: ')]
+        used_styles = {sys.intern(d.split(',', 4)[3].strip()) for d in dialogue_lines}
         new_results = list()
         for r in results:
-            found_result = False
-            for d in dialogue:
-                style = d.split(',')[3].strip()
-                if style == r.style:
-                    new_results.append(r)
-                    found_result = True
-                    break
-            if not found_result:
+            if r.style in used_styles:
+                new_results.append(r)
+            else:
                 logger.debug(
                     f"Removing style '{r.style}': not referenced in dialogue.")
         return new_results
 
-    def process_dialogue_section(self) -> list[SubFont]:
+    def process_dialogue_section(self, dialogue_lines: list[str]) -> list[SubFont]:
         """Process all dialog for font family/subfamily tags.
 
+        Args:
+            dialogue_lines (list[str]): The 'Dialogue' lines of the subtitles.
+
         Returns:
             list[SubFont]: A list of all the fonts found in the dialogue section.
         """
-        content = [i for i in self.content if i.startswith('Dialogue: ')]
         results = list()
-        for idx, c in enumerate(content):
-            dialogue = ''.join(c.split(',')[9:])
-            style = [i for i in self._styles if i.style == c.split(',')[3]][0]
-            family, subfamilies, not_subfamilies = None, list(), list()
-            if (font_name := re.search(r'\\fn(.+?)(?:[}\\])', dialogue)):
-                family = font_name.group(1)
-            if (bold := re.search(r'\\b(\d+)(?:[}\\])', dialogue)):
-                if int(bold.group(1)) == 0:
+        style_map = {s.style: s for s in self._styles}
+        for idx, c in enumerate(dialogue_lines):
+            style_name, dialogue = _fields(c, (3, 9))
+            if '{' not in dialogue:
+                continue
+            style = style_map.get(sys.intern(style_name.strip()))
+            if style is None:
+                continue
+            family, bold, italic = _parse_override_tags(dialogue)
+            subfamilies, not_subfamilies = list(), list()
+            if bold is not None:
+                if bold == 0:
                     not_subfamilies.append("bold")
                 else:
                     subfamilies.append("bold")
-            if (italic := re.search(r'\\i(\d)(?:[}\\])', dialogue)):
-                if int(italic.group(1)) == 0:
+            if italic is not None:
+                if italic == 0:
                     not_subfamilies.append("italic")
                 else:
                     subfamilies.append("italic")
@@ -134,11 +294,7 @@ class SubParse:
                 if not family:
                     family = style.family
                     if subfamilies:
-                        subfamilies = list(
-                            set(subfamilies).union(style.subfamily))
-                    else:
-                        subfamilies = list(
-                            set(subfamilies).difference(not_subfamilies))
+                        subfamilies = list(style._subfamily_set.union(subfamilies))
                 results.append(
                     SubFont(f"dialogue:{idx:05}", family, subfamilies))
         return results
@@ -0,0 +1,183 @@
+import dataclasses
+import pickle
+from pathlib import Path
+
+import pytest
+from fontTools import ttLib
+from fontTools.fontBuilder import FontBuilder
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+
+from fontscrape.fonts import FontLibrary, FontResult
+from fontscrape.subparse import SubFont
+
+FONTS = [
+    ("Lato", "Regular"),
+    ("Lato", "Bold"),
+    ("Lato", "Light Italic"),
+    ("Source Code Pro", "Regular"),
+]
+
+
+def build_font(path: Path, family: str, subfamily: str):
+    """Write a minimal TrueType font with the given names to `path`."""
+    fb = FontBuilder(1000, isTTF=True)
+    fb.setupGlyphOrder([".notdef"])
+    fb.setupCharacterMap({})
+    fb.setupGlyf({".notdef": TTGlyphPen(None).glyph()})
+    fb.setupHorizontalMetrics({".notdef": (500, 0)})
+    fb.setupHorizontalHeader(ascent=800, descent=-200)
+    fb.setupNameTable({"familyName": family, "styleName": subfamily, "fullName": f"{family} {subfamily}"})
+    fb.setupOS2()
+    fb.setupPost()
+    fb.save(str(path))
+
+
+@pytest.fixture
+def library_path(tmp_path: Path) -> Path:
+    fonts = tmp_path / "fonts"
+    fonts.mkdir()
+    for family, subfamily in FONTS:
+        build_font(fonts / f"{family}-{subfamily}.ttf".replace(" ", ""), family, subfamily)
+    return fonts
+
+
+@pytest.fixture
+def library(library_path: Path) -> FontLibrary:
+    return FontLibrary(library_path, cache_path=None)
+
+
+def test_parse_library(library: FontLibrary):
+    # fontTools leaves 'Regular' off of the full name it builds from the family and subfamily names.
+    assert sorted(f.full_name for f in library.library) == [
+        "Lato", "Lato Bold", "Lato Light Italic", "Source Code Pro"]
+
+
+def test_full_name_cache_hits(library: FontLibrary):
+    first = library.find_font_by_full_name("Lato", ["Light", "Italic"])
+    assert library._full_name_cache.cache_info().hits == 0
+    second = library.find_font_by_full_name("Lato", "Light Italic")
+    assert library._full_name_cache.cache_info().hits == 1
+    assert second is first
+    assert first.font.full_name == "Lato Light Italic"
+
+
+def test_reload_clears_cache(library: FontLibrary, library_path: Path):
+    assert library.find_font_by_full_name("Lato", ["Bold"]).font.font_path.name == "Lato-Bold.ttf"
+    library.parse_library()
+    assert library._full_name_cache.cache_info().currsize == 1
+    (library_path / "Lato-Bold.ttf").rename(library_path / "Lato-BoldRenamed.ttf")
+    library.reload()
+    assert library._full_name_cache.cache_info().currsize == 0
+    assert library.find_font_by_full_name("Lato", ["Bold"]).font.font_path.name == "Lato-BoldRenamed.ttf"
+
+
+def test_reload_picks_up_library_changes(library: FontLibrary, library_path: Path):
+    (library_path / "Lato-Regular.ttf").unlink()
+    (library_path / "Lato-Bold.ttf").unlink()
+    (library_path / "Lato-LightItalic.ttf").unlink()
+    build_font(library_path / "Inter-Bold.ttf", "Inter", "Bold")
+    library.reload()
+    assert sorted(f.full_name for f in library.library) == ["Inter Bold", "Source Code Pro"]
+    assert library.find_font_by_family("Lat", threshold=80) == []
+    assert [r.font.family for r in library.find_font_by_family("Source Code Pr")] == ["Source Code Pro"]
+    assert library.find_font_by_families("Inter", ["bold"]).font.full_name == "Inter Bold"
+
+
+def test_assigning_library_rebuilds_indexes(library: FontLibrary, library_path: Path):
+    (library_path / "SourceCodePro-Regular.ttf").unlink()
+    library.library = library.parse_library()
+    assert library.find_font_by_family("Source Code Pr") == []
+    assert len(library.find_font_by_family("Lato")) == 3
+
+
+def test_font_result_is_immutable(library: FontLibrary):
+    result = library.find_font_by_full_name("Lato", ["Bold"])
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        result.downgrade = True
+    assert FontResult(result.font, 100, 50) < FontResult(result.font, 100, 60) < FontResult(result.font, 101, 0)
+
+
+def test_threshold_uses_rounded_score(library: FontLibrary):
+    # fuzz.ratio("Lat", "lato") is 85.7, which rounds up to 86.
+    assert [r.family_match_score for r in library.find_font_by_family("Lat", threshold=86)] == [86, 86, 86]
+    assert library.find_font_by_family("Lat", threshold=87) == []
+    assert len(library.find_font_by_family("Lat", threshold=0)) == len(FONTS)
+    assert library.find_font_by_family("Lato", threshold=101) == []
+    assert library.find_fonts_batch([SubFont("s", "Zzz", ["bold"])], threshold=0)[0] is not None
+    assert library.find_fonts_batch([SubFont("s", "Lat", ["bold"])], threshold=101)[0] is None
+
+
+def test_family_lookup_ignores_case(library: FontLibrary):
+    assert library.find_font_by_families("LATO", ["bold"]).font == library.find_font_by_families("Lato", ["bold"]).font
+    fuzzy = library.find_font_by_families("SOURCE CODE PROS", ["regular"])
+    assert fuzzy.font.family == "Source Code Pro"
+    assert fuzzy.family_match_score == library.find_font_by_families("source code pros", ["regular"]).family_match_score
+    assert [r.family_match_score for r in library.find_font_by_family("source code PRO")] == [100]
+
+
+def test_disk_cache_round_trip(library_path: Path, tmp_path: Path):
+    cache_path = tmp_path / "cache" / "library.pkl"
+    parsed = FontLibrary(library_path, cache_path=cache_path).library
+    assert cache_path.exists()
+    cached = FontLibrary(library_path, cache_path=cache_path).library
+    assert [(f.full_name, f.font_path) for f in cached] == [(f.full_name, f.font_path) for f in parsed]
+
+
+@pytest.mark.parametrize("contents", [b"", b"not a pickle", b"\x80\x09"])
+def test_disk_cache_unreadable(library_path: Path, tmp_path: Path, contents: bytes):
+    cache_path = tmp_path / "library.pkl"
+    cache_path.write_bytes(contents)
+    assert len(FontLibrary(library_path, cache_path=cache_path).library) == len(FONTS)
+    assert len(FontLibrary(library_path, cache_path=cache_path).library) == len(FONTS)
+
+
+def test_disk_cache_version_mismatch(library_path: Path, tmp_path: Path):
+    cache_path = tmp_path / "library.pkl"
+    FontLibrary(library_path, cache_path=cache_path)
+    with cache_path.open("rb") as f:
+        cached = pickle.load(f)
+    cached["version"] -= 1
+    cached["entries"] = {k: (*v[:2], ("Stale", "Regular", "Stale Regular")) for k, v in cached["entries"].items()}
+    with cache_path.open("wb") as f:
+        pickle.dump(cached, f)
+    assert "Stale" not in {f.family for f in FontLibrary(library_path, cache_path=cache_path).library}
+
+
+def test_find_fonts_batch_matches_full_name_lookup(library_path: Path):
+    build_font(library_path / "Inter-SemiBoldItalic.ttf", "Inter", "SemiBold Italic")
+    library = FontLibrary(library_path, cache_path=None)
+    styles = [
+        SubFont("exact", "Lato", ["light", "italic"]),
+        SubFont("fuzzy", "Lato", ["bolds"]),
+        SubFont("semi", "Inter", ["bold", "italic"]),
+        SubFont("downgrade", "Source Code Pro", ["black", "italic"]),
+        SubFont("missing", "Zzz", []),
+    ]
+
+    def key(result):
+        return result and (result.font.font_path, result.family_match_score, result.subfamily_match_score,
+                           result.downgrade)
+
+    batch = [key(r) for r in library.find_fonts_batch(styles, downgrade=True)]
+    library._full_name_cache.cache_clear()
+    single = [key(library.find_font_by_full_name(s.family, s.subfamily, downgrade=True)) for s in styles]
+    assert batch == single
+    exact, fuzzy, semi, downgrade, missing = batch
+    assert exact[0].name == "Lato-LightItalic.ttf" and exact[1:] == (100, 100, False)
+    assert fuzzy[0].name == "Lato-Bold.ttf" and 90 <= fuzzy[1] < 100 and not fuzzy[3]
+    assert semi[0].name == "Inter-SemiBoldItalic.ttf" and semi[1:] == (100, 0, False)
+    assert downgrade[0].name == "SourceCodePro-Regular.ttf" and downgrade[3]
+    assert missing is None
+
+
+def test_unparseable_fonts_are_skipped(library_path: Path):
+    build_font(library_path / "NoName.ttf", "NoName", "Regular")
+    with ttLib.TTFont(library_path / "NoName.ttf") as ttf:
+        del ttf["name"]
+        ttf.save(library_path / "NoName.ttf")
+    build_font(library_path / "EmptyName.ttf", "EmptyName", "Regular")
+    with ttLib.TTFont(library_path / "EmptyName.ttf") as ttf:
+        ttf["name"].names = list()
+        ttf.save(library_path / "EmptyName.ttf")
+    (library_path / "Garbage.otf").write_bytes(b"not a font")
+    assert len(FontLibrary(library_path, cache_path=None).library) == len(FONTS)
@@ -0,0 +1,101 @@
+import pickle
+from pathlib import Path
+
+import pytest
+
+from fontscrape.subparse import SubParse, _fields, _parse_override_tags
+
+LINES = [
+    "[V4+ Styles]",
+    "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic",
+    "Style: Default,Lato,20,&H0,&H0,&H0,&H0,-1,0,0,0,100,100,0,0,1,2,2,2,10,10,10,1",
+    "Style: Alt,Source Code Pro,20,&H0,&H0,&H0,&H0,0,-1,0,0,100,100,0,0,1,2,2,2,10,10,10,1",
+    "Style: Unused,Comic Sans,20,&H0,&H0,&H0,&H0,0,0,0,0,100,100,0,0,1,2,2,2,10,10,10,1",
+    "",
+    "[Events]",
+    "Dialogue: 0,0:00:00.00,0:00:01.00,Default,,0,0,0,,{\\fnFoo Bar\\b1}Hello, there",
+    "Dialogue: 0,0:00:01.00,0:00:02.00,Alt,,0,0,0,,{\\i0}General Kenobi",
+]
+
+
+def fonts(sub: SubParse) -> list[tuple[str, list[str]]]:
+    return [(f.family, sorted(f.subfamily)) for f in sub.styles]
+
+
+@pytest.fixture
+def ssa_file(tmp_path: Path) -> Path:
+    path = tmp_path / "episode.ass"
+    path.write_text("\n".join(LINES) + "\n", encoding="utf-8")
+    return path
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n", "\r"])
+def test_line_endings(tmp_path: Path, newline: str):
+    path = tmp_path / "episode.ass"
+    path.write_bytes((newline.join(LINES) + newline).encode("utf-8"))
+    assert fonts(SubParse(path)) == [
+        ("Lato", ["bold"]), ("Source Code Pro", ["italic"]), ("Foo Bar", ["bold"]), ("Source Code Pro", [])]
+
+
+def test_filter_unused_styles(ssa_file: Path):
+    assert "Comic Sans" not in {f.family for f in SubParse(ssa_file).styles}
+    assert "Comic Sans" in {f.family for f in SubParse(ssa_file, filter_unused_styles=False).styles}
+
+
+def test_from_cache(ssa_file: Path, tmp_path: Path):
+    cache_dir = tmp_path / "cache"
+    parsed = SubParse.from_cache(ssa_file, cache_dir)
+    assert (cache_dir / "episode.ass.pkl").exists()
+    assert fonts(SubParse.from_cache(ssa_file, cache_dir)) == fonts(parsed)
+
+
+def test_from_cache_version_mismatch(ssa_file: Path, tmp_path: Path):
+    cache_dir = tmp_path / "cache"
+    SubParse.from_cache(ssa_file, cache_dir)
+    cache_file = cache_dir / "episode.ass.pkl"
+    with cache_file.open("rb") as f:
+        cached = pickle.load(f)
+    cached["version"] -= 1
+    cached["styles"] = list()
+    with cache_file.open("wb") as f:
+        pickle.dump(cached, f)
+    assert fonts(SubParse.from_cache(ssa_file, cache_dir)) == fonts(SubParse(ssa_file))
+
+
+@pytest.mark.parametrize("contents", [b"", b"not a pickle", b"\x80\x09", pickle.dumps(["not", "a", "dict"])])
+def test_from_cache_corrupt(ssa_file: Path, tmp_path: Path, contents: bytes):
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    (cache_dir / "episode.ass.pkl").write_bytes(contents)
+    assert fonts(SubParse.from_cache(ssa_file, cache_dir)) == fonts(SubParse(ssa_file))
+    assert fonts(SubParse.from_cache(ssa_file, cache_dir)) == fonts(SubParse(ssa_file))
+    assert [p.name for p in cache_dir.iterdir()] == ["episode.ass.pkl"]
+
+
+@pytest.mark.parametrize("dialogue, expected", [
+    ("{\\bord2\\be1\\blur3}Text", (None, None, None)),
+    ("{\\bord2\\be1\\blur3\\b1}Text", (None, 1, None)),
+    ("{\\i12}Text", (None, None, None)),
+    ("{\\i1}Text", (None, None, 1)),
+    ("{\\b700}Text", (None, 700, None)),
+    ("{\\b0}Te{\\b1}xt", (None, 0, None)),
+    ("{\\fnArial}Te{\\b1}x{\\i0}t", ("Arial", 1, 0)),
+    ("\\fnArial\\b1\\i1 is not an override {\\i0}Text", (None, None, 0)),
+    ("Plain \\fnArial\\b1} text", (None, None, None)),
+    ("{\\fnFoo, Bar\\b1}Hello, there", ("Foo, Bar", 1, None)),
+    ("{\\b1", (None, None, None)),
+    ("{\\b1\\fnArial", (None, 1, None)),
+])
+def test_parse_override_tags(dialogue: str, expected: tuple):
+    assert _parse_override_tags(dialogue) == expected
+
+
+@pytest.mark.parametrize("line, indices, expected", [
+    ("Dialogue: 0,0:00:00.00,0:00:01.00,Default,,0,0,0,,Hello, there", (3, 9), ["Default", "Hello, there"]),
+    ("Dialogue: 0,0:00:00.00,0:00:01.00,Default,,0,0,0,,{\\fnFoo, Bar}Hi", (9,), ["{\\fnFoo, Bar}Hi"]),
+    ("a,b,c", (0, 1), ["a", "b,c"]),
+    ("a,b", (1, 3), ["b", ""]),
+    ("a", (2, 3), ["", ""]),
+])
+def test_fields(line: str, indices: tuple, expected: list):
+    assert _fields(line, indices) == expected